@@ -0,0 +1,47 @@
+"""JSON helpers shared by the MCP server and the websocket bridge.
+
+``orjson`` is used when it is installed; otherwise the stdlib ``json`` module
+is used with matching output (compact separators, UTF-8 encoded bytes).
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - exercised only without orjson
+    orjson = None  # type: ignore[assignment]
+
+if orjson is not None:
+    JSONDecodeError = orjson.JSONDecodeError
+    loads = orjson.loads
+
+    def dumps(obj: Any) -> bytes:
+        """Serialize ``obj`` to compact JSON bytes."""
+
+        return orjson.dumps(obj)
+
+    def dumps_pretty(obj: Any) -> str:
+        """Serialize ``obj`` to an indented JSON string for display."""
+
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+
+else:  # pragma: no cover - exercised only without orjson
+    import json
+
+    JSONDecodeError = json.JSONDecodeError
+    loads = json.loads
+
+    def dumps(obj: Any) -> bytes:
+        """Serialize ``obj`` to compact JSON bytes."""
+
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+    def dumps_pretty(obj: Any) -> str:
+        """Serialize ``obj`` to an indented JSON string for display."""
+
+        return json.dumps(obj, ensure_ascii=False, indent=2)
+
+
+__all__ = ["JSONDecodeError", "dumps", "dumps_pretty", "loads"]
@@ -0,0 +1,4 @@
+"""Wire-protocol constants shared by the MCP server and the websocket bridge."""
+
+# MCP clients negotiating this subprotocol skip the JSON role handshake.
+MCP_SUBPROTOCOL = "aframe-mcp-v1"
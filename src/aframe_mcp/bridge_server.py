@@ -4,14 +4,19 @@ from __future__ import annotations
 
 import argparse
 import asyncio
-import json
 import logging
 import os
+import re
+from collections import defaultdict
 from dataclasses import dataclass
-from typing import Dict, Optional
+from typing import Any, DefaultDict, Dict, Optional, Sequence, Set, Tuple
 
+import async_timeout
 import websockets
-from websockets.server import WebSocketServerProtocol
+from websockets.asyncio.server import ServerConnection
+
+from aframe_mcp._json import JSONDecodeError, dumps, loads
+from aframe_mcp._protocol import MCP_SUBPROTOCOL
 
 logger = logging.getLogger("AFrameBridge")
 logging.basicConfig(
@@ -22,27 +27,85 @@ logging.basicConfig(
 DEFAULT_HOST = os.getenv("AFRAME_BRIDGE_HOST", "127.0.0.1")
 DEFAULT_PORT = int(os.getenv("AFRAME_BRIDGE_PORT", "8765"))
 RESPONSE_TIMEOUT = float(os.getenv("AFRAME_BRIDGE_RESPONSE_TIMEOUT", "20"))
+SCENE_BATCH_SIZE = int(os.getenv("AFRAME_BRIDGE_SCENE_BATCH_SIZE", "128"))
+# JSON frames above MAX_MESSAGE_SIZE are rejected before parsing. The websocket
+# limit is MAX_BINARY_SIZE so screenshots sent as binary frames still fit.
+MAX_MESSAGE_SIZE = int(os.getenv("AFRAME_BRIDGE_MAX_MESSAGE_SIZE", str(4 * 1024 * 1024)))
+MAX_BINARY_SIZE = int(os.getenv("AFRAME_BRIDGE_MAX_BINARY_SIZE", str(16 * 1024 * 1024)))
+
+# Static replies are encoded once at import so hot paths only send bytes.
+_OK = dumps({"status": "ok"})
+_ERR_SCENE_ALREADY_CONNECTED = dumps(
+    {"status": "error", "message": "A scene is already connected"}
+)
+_ERR_INVALID_PAYLOAD = dumps({"status": "error", "message": "Invalid command payload"})
+_ERR_MESSAGE_TOO_LARGE = dumps({"status": "error", "message": "Command payload too large"})
+_ERR_NO_REQUEST_ID = dumps(
+    {"status": "error", "message": "Commands must include requestId"}
+)
+# Reads a plain ASCII requestId that opens a message object without parsing the
+# whole frame. AFrameConnection and the scene script both send requestId first.
+_REQUEST_ID_PATTERN = re.compile(rb'\{\s*"requestId"\s*:\s*"([ !#-\[\]-~]+)"')
+_SAFE_SCENE_ID = re.compile(r"[A-Za-z0-9_.:-]+")
+
+
+def _ready_frame(scene_id: str) -> bytes:
+    """Build the scene acknowledgement, skipping JSON encoding for plain ids."""
+
+    if _SAFE_SCENE_ID.fullmatch(scene_id):
+        return f'{{"status":"ready","sceneId":"{scene_id}"}}'.encode()
+    return dumps({"status": "ready", "sceneId": scene_id})
+
+
+def _select_subprotocol(
+    connection: ServerConnection, subprotocols: Sequence[str]
+) -> Optional[str]:
+    """Accept the MCP subprotocol when offered; clients offering none still connect."""
 
+    return MCP_SUBPROTOCOL if MCP_SUBPROTOCOL in subprotocols else None
 
-@dataclass
+
+def _error_frame(request_id: str, message: str) -> bytes:
+    return dumps({"requestId": request_id, "status": "error", "message": message})
+
+
+async def _send_frames(
+    websocket: ServerConnection, lock: asyncio.Lock, *frames: bytes
+) -> None:
+    """Send ``frames`` back to back, without interleaving other replies."""
+
+    async with lock:
+        for frame in frames:
+            await websocket.send(frame)
+
+
+@dataclass(slots=True)
 class PendingMessage:
     future: asyncio.Future
-    client: WebSocketServerProtocol
+    client: ServerConnection
+    binary_payload: Optional[bytes] = None
 
 
 class BridgeServer:
     """Routes commands between MCP clients and a connected A-Frame scene."""
 
     def __init__(self) -> None:
-        self.scene: Optional[WebSocketServerProtocol] = None
+        self.scene: Optional[ServerConnection] = None
         self.scene_id: Optional[str] = None
         self.pending: Dict[str, PendingMessage] = {}
+        self._client_pending: DefaultDict[ServerConnection, Set[str]] = defaultdict(set)
         self.scene_lock = asyncio.Lock()
+        self._scene_out: Optional[asyncio.Queue[bytes]] = None
 
-    async def handler(self, websocket: WebSocketServerProtocol) -> None:
+    async def handler(self, websocket: ServerConnection) -> None:
         """Handle new websocket connections."""
+        if websocket.subprotocol == MCP_SUBPROTOCOL:
+            await self._register_mcp(websocket, acknowledge=False)
+            return
+
         try:
-            raw = await asyncio.wait_for(websocket.recv(), timeout=5)
+            async with async_timeout.timeout(5):
+                raw = await websocket.recv()
         except asyncio.TimeoutError:
             await websocket.close(code=4000, reason="Handshake timeout")
             return
@@ -50,8 +113,8 @@ class BridgeServer:
             return
 
         try:
-            handshake = json.loads(raw)
-        except json.JSONDecodeError:
+            handshake = loads(raw)
+        except JSONDecodeError:
             await websocket.close(code=4001, reason="Invalid handshake payload")
             return
 
@@ -64,137 +127,262 @@ class BridgeServer:
             await websocket.close(code=4002, reason="Unknown role")
 
     async def _register_scene(
-        self, websocket: WebSocketServerProtocol, handshake: Dict[str, str]
+        self, websocket: ServerConnection, handshake: Dict[str, str]
     ) -> None:
         async with self.scene_lock:
             if self.scene is not None:
-                await websocket.send(
-                    json.dumps(
-                        {
-                            "status": "error",
-                            "message": "A scene is already connected",
-                        }
-                    )
-                )
+                await websocket.send(_ERR_SCENE_ALREADY_CONNECTED)
                 await websocket.close(code=4003, reason="Scene already connected")
                 return
             self.scene = websocket
-            self.scene_id = handshake.get("sceneId") or "default"
+            self.scene_id = str(handshake.get("sceneId") or "default")
+            self._scene_out = asyncio.Queue()
 
-        await websocket.send(json.dumps({"status": "ready", "sceneId": self.scene_id}))
+        await websocket.send(_ready_frame(self.scene_id))
         logger.info("Scene connected: %s", self.scene_id)
+        writer = asyncio.create_task(self._scene_writer(websocket, self._scene_out))
 
+        # A response flagged with "binary" is followed by one raw binary frame.
+        awaiting_binary: Optional[Tuple[Optional[PendingMessage], Dict[str, Any]]] = None
         try:
             async for raw in websocket:
+                if awaiting_binary is not None:
+                    pending, message = awaiting_binary
+                    awaiting_binary = None
+                    if pending is None or pending.future.done():
+                        continue
+                    if isinstance(raw, bytes):
+                        pending.binary_payload = raw
+                    else:
+                        logger.warning(
+                            "Expected binary frame for request %s", message["requestId"]
+                        )
+                        message = {
+                            "requestId": message["requestId"],
+                            "status": "error",
+                            "message": "Scene did not send the binary payload",
+                        }
+                    pending.future.set_result(message)
+                    continue
+
+                frame = raw.encode() if isinstance(raw, str) else raw
+                if len(frame) > MAX_MESSAGE_SIZE:
+                    self._reject_oversized_response(frame)
+                    continue
+
                 try:
-                    message = json.loads(raw)
-                except json.JSONDecodeError:
+                    message = loads(frame)
+                except JSONDecodeError:
                     logger.warning("Invalid message from scene: %s", raw[:200])
                     continue
 
-                request_id = message.get("requestId")
-                if not request_id:
+                request_id = message.get("requestId") if isinstance(message, dict) else None
+                if not isinstance(request_id, str) or not request_id:
                     logger.warning("Scene message missing requestId: %s", message)
                     continue
 
-                pending = self.pending.pop(request_id, None)
+                pending = self._pop_pending(request_id)
+                if message.get("binary"):
+                    awaiting_binary = (pending, message)
+
                 if not pending:
                     logger.warning("No pending request for id %s", request_id)
                     continue
 
-                pending.future.set_result(message)
+                if awaiting_binary is None and not pending.future.done():
+                    pending.future.set_result(message)
         except websockets.ConnectionClosed:
             logger.info("Scene connection closed")
         finally:
+            writer.cancel()
+            if awaiting_binary is not None:
+                # Already popped from self.pending, so _flush_pending cannot see it.
+                pending, message = awaiting_binary
+                if pending is not None and not pending.future.done():
+                    pending.future.set_result(
+                        {
+                            "requestId": message["requestId"],
+                            "status": "error",
+                            "message": "Scene disconnected",
+                        }
+                    )
             async with self.scene_lock:
                 self.scene = None
                 self.scene_id = None
+                self._scene_out = None
             self._flush_pending("Scene disconnected")
 
-    async def _register_mcp(self, websocket: WebSocketServerProtocol) -> None:
-        await websocket.send(json.dumps({"status": "ok"}))
+    def _reject_oversized_response(self, frame: bytes) -> None:
+        """Fail the request behind an oversized scene response instead of dropping it."""
+
+        match = _REQUEST_ID_PATTERN.match(frame)
+        request_id = match.group(1).decode("ascii") if match else None
+        logger.warning(
+            "Dropping oversized scene response for %s (%s bytes)", request_id, len(frame)
+        )
+        pending = self._pop_pending(request_id) if request_id else None
+        if pending is not None and not pending.future.done():
+            pending.future.set_result(
+                {
+                    "requestId": request_id,
+                    "status": "error",
+                    "message": "Scene response too large",
+                }
+            )
+
+    async def _scene_writer(
+        self, websocket: ServerConnection, queue: asyncio.Queue[bytes]
+    ) -> None:
+        """Drain queued commands to the scene, coalescing ready ones into one frame.
+
+        Commands are single-line JSON, so a batch is sent newline-delimited and
+        the scene parses each line on its own; one malformed command cannot
+        spoil the others in its batch.
+        """
+        try:
+            while True:
+                batch = [await queue.get()]
+                while len(batch) < SCENE_BATCH_SIZE and not queue.empty():
+                    batch.append(queue.get_nowait())
+
+                await websocket.send(b"\n".join(batch))
+        except websockets.ConnectionClosed:
+            logger.info("Scene writer stopped: connection closed")
+
+    async def _register_mcp(
+        self, websocket: ServerConnection, acknowledge: bool = True
+    ) -> None:
+        if acknowledge:
+            await websocket.send(_OK)
         logger.info("MCP client connected")
+        # Commands are relayed concurrently, so replies share a send lock to keep a
+        # binary header and its payload frame adjacent.
+        send_lock = asyncio.Lock()
+        relays: Set[asyncio.Task] = set()
         try:
             async for raw in websocket:
-                try:
-                    message = json.loads(raw)
-                except json.JSONDecodeError:
-                    await websocket.send(
-                        json.dumps(
-                            {
-                                "status": "error",
-                                "message": "Invalid command payload",
-                            }
+                frame = raw.encode() if isinstance(raw, str) else raw
+                match = _REQUEST_ID_PATTERN.match(frame)
+                if len(frame) > MAX_MESSAGE_SIZE:
+                    if match is None:
+                        await _send_frames(websocket, send_lock, _ERR_MESSAGE_TOO_LARGE)
+                    else:
+                        await _send_frames(
+                            websocket,
+                            send_lock,
+                            _error_frame(
+                                match.group(1).decode("ascii"), "Command payload too large"
+                            ),
                         )
-                    )
                     continue
 
-                request_id = message.get("requestId")
-                if not request_id:
-                    await websocket.send(
-                        json.dumps(
-                            {
-                                "status": "error",
-                                "message": "Commands must include requestId",
-                            }
+                if match is not None and b"\n" not in frame:
+                    request_id = match.group(1).decode("ascii")
+                else:
+                    # Anything else (requestId not first, escaped ids, multi-line frames)
+                    # takes the full parse path; the re-encoded frame is compact so it
+                    # stays on one line in a batch.
+                    try:
+                        message = loads(frame)
+                    except JSONDecodeError:
+                        await _send_frames(
+                            websocket,
+                            send_lock,
+                            _ERR_INVALID_PAYLOAD
+                            if match is None
+                            else _error_frame(
+                                match.group(1).decode("ascii"), "Invalid command payload"
+                            ),
                         )
+                        continue
+
+                    if not isinstance(message, dict):
+                        await _send_frames(websocket, send_lock, _ERR_INVALID_PAYLOAD)
+                        continue
+
+                    request_id = message.get("requestId")
+                    if not isinstance(request_id, str) or not request_id:
+                        await _send_frames(websocket, send_lock, _ERR_NO_REQUEST_ID)
+                        continue
+                    frame = dumps(message)
+
+                if self.scene is None or self._scene_out is None:
+                    await _send_frames(
+                        websocket,
+                        send_lock,
+                        _error_frame(request_id, "No A-Frame scene is connected"),
                     )
                     continue
 
-                if self.scene is None:
-                    await websocket.send(
-                        json.dumps(
-                            {
-                                "requestId": request_id,
-                                "status": "error",
-                                "message": "No A-Frame scene is connected",
-                            }
-                        )
+                if request_id in self.pending:
+                    await _send_frames(
+                        websocket,
+                        send_lock,
+                        _error_frame(request_id, "Duplicate requestId already in flight"),
                     )
                     continue
 
                 future = asyncio.get_running_loop().create_future()
-                self.pending[request_id] = PendingMessage(future=future, client=websocket)
-
-                try:
-                    await self.scene.send(json.dumps(message))
-                except websockets.ConnectionClosed:
-                    await websocket.send(
-                        json.dumps(
-                            {
-                                "requestId": request_id,
-                                "status": "error",
-                                "message": "Scene disconnected",
-                            }
-                        )
-                    )
-                    self.pending.pop(request_id, None)
-                    continue
+                pending = PendingMessage(future=future, client=websocket)
+                self.pending[request_id] = pending
+                self._client_pending[websocket].add(request_id)
 
-                try:
-                    response = await asyncio.wait_for(future, timeout=RESPONSE_TIMEOUT)
-                except asyncio.TimeoutError:
-                    await websocket.send(
-                        json.dumps(
-                            {
-                                "requestId": request_id,
-                                "status": "error",
-                                "message": "Timed out waiting for scene response",
-                            }
-                        )
-                    )
-                    self.pending.pop(request_id, None)
-                    continue
+                # Forward the frame as received; the scene does the full parse.
+                self._scene_out.put_nowait(frame)
 
-                await websocket.send(json.dumps(response))
-                self.pending.pop(request_id, None)
+                relay = asyncio.create_task(
+                    self._relay_response(websocket, send_lock, request_id, pending)
+                )
+                relays.add(relay)
+                relay.add_done_callback(relays.discard)
         except websockets.ConnectionClosed:
             logger.info("MCP client disconnected")
         finally:
-            to_cancel = [key for key, value in self.pending.items() if value.client == websocket]
-            for key in to_cancel:
-                pending = self.pending.pop(key)
-                pending.future.cancel()
+            for relay in list(relays):
+                relay.cancel()
+            for key in self._client_pending.pop(websocket, ()):
+                pending = self.pending.pop(key, None)
+                if pending is not None:
+                    pending.future.cancel()
+
+    async def _relay_response(
+        self,
+        websocket: ServerConnection,
+        send_lock: asyncio.Lock,
+        request_id: str,
+        pending: PendingMessage,
+    ) -> None:
+        """Wait for the scene's answer to one command and send it to the MCP client."""
+        try:
+            try:
+                async with async_timeout.timeout(RESPONSE_TIMEOUT):
+                    response = await pending.future
+            except asyncio.TimeoutError:
+                self._pop_pending(request_id)
+                await _send_frames(
+                    websocket,
+                    send_lock,
+                    _error_frame(request_id, "Timed out waiting for scene response"),
+                )
+                return
+
+            # The scene reader already popped the entry before resolving it.
+            if pending.binary_payload is not None:
+                await _send_frames(
+                    websocket, send_lock, dumps(response), pending.binary_payload
+                )
+            else:
+                await _send_frames(websocket, send_lock, dumps(response))
+        except websockets.ConnectionClosed:
+            pass
+
+    def _pop_pending(self, request_id: str) -> Optional[PendingMessage]:
+        pending = self.pending.pop(request_id, None)
+        if pending is not None:
+            client_keys = self._client_pending.get(pending.client)
+            if client_keys is not None:
+                client_keys.discard(request_id)
+        return pending
 
     def _flush_pending(self, message: str) -> None:
         for key, pending in list(self.pending.items()):
@@ -207,10 +395,19 @@ class BridgeServer:
                     }
                 )
             self.pending.pop(key, None)
+        self._client_pending.clear()
 
     async def run(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> None:
         logger.info("Starting bridge on ws://%s:%s", host, port)
-        async with websockets.serve(self.handler, host, port):
+        # Commands are small JSON frames where permessage-deflate costs more than it saves.
+        async with websockets.serve(
+            self.handler,
+            host,
+            port,
+            compression=None,
+            select_subprotocol=_select_subprotocol,
+            max_size=MAX_BINARY_SIZE,
+        ):
             await asyncio.Future()  # Run forever
 
 
@@ -3,15 +3,19 @@
 from __future__ import annotations
 
 import asyncio
-import base64
-import json
+import concurrent.futures
+import itertools
 import logging
 import os
-import uuid
+import secrets
+import threading
+import time
 from contextlib import asynccontextmanager
-from dataclasses import dataclass
-from typing import Any, AsyncIterator, Dict, Optional
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+from urllib.parse import urlparse
 
+import async_timeout
 from mcp.server.fastmcp import Context, FastMCP, Image, Resource
 
 try:  # Optional dependency for typing
@@ -21,6 +25,9 @@ except ImportError as exc:  # pragma: no cover - handled at runtime
         "The 'websockets' package is required to run the A-Frame MCP server."
     ) from exc
 
+from aframe_mcp._json import JSONDecodeError, dumps, dumps_pretty, loads
+from aframe_mcp._protocol import MCP_SUBPROTOCOL
+
 
 logger = logging.getLogger("AFrameMCP")
 logging.basicConfig(
@@ -31,73 +38,253 @@ logging.basicConfig(
 DEFAULT_BRIDGE_URL = os.getenv("AFRAME_BRIDGE_URL", "ws://localhost:8765")
 CONNECT_TIMEOUT = float(os.getenv("AFRAME_CONNECT_TIMEOUT", "5"))
 RESPONSE_TIMEOUT = float(os.getenv("AFRAME_RESPONSE_TIMEOUT", "15"))
+# Large enough for capture_view screenshots relayed as binary frames.
+MAX_MESSAGE_SIZE = int(os.getenv("AFRAME_MAX_MESSAGE_SIZE", str(16 * 1024 * 1024)))
+RECONNECT_ATTEMPTS = max(1, int(os.getenv("AFRAME_RECONNECT_ATTEMPTS", "3")))
+RECONNECT_BASE_DELAY = float(os.getenv("AFRAME_RECONNECT_BASE_DELAY", "0.5"))
+# Upper bound for a synchronous command, covering reconnect attempts plus the response wait.
+COMMAND_TIMEOUT = RESPONSE_TIMEOUT + RECONNECT_ATTEMPTS * CONNECT_TIMEOUT
+CACHE_TTL = float(os.getenv("AFRAME_CACHE_TTL", "0.5"))
+# Query results reused for CACHE_TTL seconds unless a mutating command runs in between.
+CACHEABLE_COMMANDS = frozenset({"get_scene_graph", "find_entity", "list_assets"})
+# Commands that never change scene state and therefore leave the cache intact.
+READ_ONLY_COMMANDS = CACHEABLE_COMMANDS | {"ping", "capture_view"}
+PRETTY_JSON = os.getenv("AFRAME_PRETTY_JSON", "").lower() in {"1", "true", "yes"}
+
+
+# Request ids only need to be unique per process, so a random prefix plus a
+# counter replaces a UUID per call. next() on itertools.count is atomic under the GIL.
+_REQUEST_ID_PREFIX = secrets.token_hex(4)
+_request_counter = itertools.count()
+
+
+def _next_request_id() -> str:
+    return f"{_REQUEST_ID_PREFIX}-{next(_request_counter)}"
+
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    """Return the shared event loop that runs bridge I/O, starting it on first use."""
+
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_loop.run_forever,
+                name="aframe-mcp-bridge",
+                daemon=True,
+            ).start()
+        return _loop
 
 
 @dataclass
 class AFrameConnection:
-    """Simple websocket client used to talk to the bridge server."""
+    """Websocket client that keeps a single long-lived connection to the bridge.
+
+    Requests are multiplexed over the connection by ``requestId``: several can
+    be in flight at once, and a reader task resolves the matching pending future
+    for every response.
+    """
 
     bridge_url: str = DEFAULT_BRIDGE_URL
+    _websocket: Optional[Any] = field(default=None, init=False, repr=False)
+    _reader_task: Optional[asyncio.Task] = field(default=None, init=False, repr=False)
+    _pending: Dict[str, asyncio.Future] = field(default_factory=dict, init=False, repr=False)
+    _connect_lock: Optional[asyncio.Lock] = field(default=None, init=False, repr=False)
+    _cache: Dict[Tuple[str, bytes], Tuple[int, float, Dict[str, Any]]] = field(
+        default_factory=dict, init=False, repr=False
+    )
+    _cache_version: int = field(default=0, init=False, repr=False)
+
+    async def _connect(self) -> Any:
+        """Return the open bridge connection, reconnecting with backoff if needed."""
+
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+
+        async with self._connect_lock:
+            if self._websocket is not None:
+                return self._websocket
+
+            delay = RECONNECT_BASE_DELAY
+            for attempt in range(1, RECONNECT_ATTEMPTS + 1):
+                try:
+                    websocket = await websockets.connect(
+                        self.bridge_url,
+                        open_timeout=CONNECT_TIMEOUT,
+                        close_timeout=CONNECT_TIMEOUT,
+                        ping_interval=20,
+                        compression=None,
+                        subprotocols=[MCP_SUBPROTOCOL],
+                        max_size=MAX_MESSAGE_SIZE,
+                    )
+                    break
+                except (OSError, asyncio.TimeoutError, websockets.InvalidHandshake) as exc:
+                    if attempt == RECONNECT_ATTEMPTS:
+                        raise ConnectionError(
+                            f"Unable to reach A-Frame bridge at {self.bridge_url}"
+                        ) from exc
+                    logger.info(
+                        "Bridge connection attempt %s failed, retrying in %.2fs",
+                        attempt,
+                        delay,
+                    )
+                    await asyncio.sleep(delay)
+                    delay *= 2
+
+            if websocket.subprotocol != MCP_SUBPROTOCOL:
+                # Older bridges identify the role through a JSON handshake.
+                await self._handshake(websocket)
+
+            self._websocket = websocket
+            self._reader_task = asyncio.get_running_loop().create_task(
+                self._read_responses(websocket)
+            )
+            logger.info("Opened bridge connection to %s", self.bridge_url)
+            return websocket
+
+    async def _handshake(self, websocket: Any) -> None:
+        """Identify as an MCP client and wait for the bridge acknowledgement."""
+
+        handshake = {"role": "mcp", "client": "aframe-mcp"}
+        try:
+            await websocket.send(dumps(handshake))
+            async with async_timeout.timeout(RESPONSE_TIMEOUT):
+                ack_raw = await websocket.recv()
+        except asyncio.TimeoutError as exc:
+            await websocket.close()
+            raise TimeoutError(
+                "Timed out waiting for bridge acknowledgement"
+            ) from exc
+
+        ack = loads(ack_raw)
+        if ack.get("status") not in {"ok", "ready"}:
+            await websocket.close()
+            raise RuntimeError(
+                ack.get("message", "Bridge rejected MCP connection")
+            )
+
+    async def _read_responses(self, websocket: Any) -> None:
+        """Resolve pending requests as responses arrive on ``websocket``."""
+
+        # A response flagged with "binary" is followed by one raw binary frame.
+        awaiting_binary: Optional[Dict[str, Any]] = None
+        try:
+            async for raw in websocket:
+                if awaiting_binary is not None:
+                    response, awaiting_binary = awaiting_binary, None
+                    if isinstance(raw, bytes):
+                        response["binaryPayload"] = raw
+                    else:
+                        logger.warning(
+                            "Expected binary frame for request %s", response.get("requestId")
+                        )
+                        response = {
+                            "requestId": response.get("requestId"),
+                            "status": "error",
+                            "message": "Bridge did not send the binary payload",
+                        }
+                else:
+                    try:
+                        response = loads(raw)
+                    except JSONDecodeError:
+                        logger.warning("Invalid message from bridge: %s", raw[:200])
+                        continue
+
+                    if response.get("binary"):
+                        awaiting_binary = response
+                        continue
+
+                request_id = response.get("requestId")
+                if request_id is None:
+                    # Requests run concurrently on the bridge, so an untagged reply
+                    # cannot be matched to one; it only follows a malformed command.
+                    logger.warning("Bridge reply without requestId: %s", response)
+                    continue
+
+                future = self._pending.pop(request_id, None)
+                if future is None:
+                    logger.warning("No pending request for bridge response: %s", response)
+                    continue
+
+                if not future.done():
+                    future.set_result(response)
+        except websockets.ConnectionClosed:
+            logger.info("Bridge connection closed")
+        finally:
+            if self._websocket is websocket:
+                self._websocket = None
+            if self._reader_task is asyncio.current_task():
+                self._reader_task = None
+            pending, self._pending = self._pending, {}
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Bridge connection closed"))
 
     async def _send(self, payload: Dict[str, Any]) -> Dict[str, Any]:
         """Send a payload to the bridge and await the response."""
-        request_id = payload.setdefault("requestId", str(uuid.uuid4()))
-        async with websockets.connect(
-            self.bridge_url,
-            open_timeout=CONNECT_TIMEOUT,
-            close_timeout=CONNECT_TIMEOUT,
-            ping_timeout=None,
-        ) as websocket:
-            handshake = {"role": "mcp", "client": "aframe-mcp"}
-            await websocket.send(json.dumps(handshake))
-
-            try:
-                ack_raw = await asyncio.wait_for(
-                    websocket.recv(), timeout=RESPONSE_TIMEOUT
-                )
-                ack = json.loads(ack_raw)
-                if ack.get("status") not in {"ok", "ready"}:
-                    raise RuntimeError(
-                        ack.get("message", "Bridge rejected MCP connection")
-                    )
-            except asyncio.TimeoutError as exc:
-                raise TimeoutError(
-                    "Timed out waiting for bridge acknowledgement"
-                ) from exc
-
-            await websocket.send(json.dumps(payload))
-
-            try:
-                response_raw = await asyncio.wait_for(
-                    websocket.recv(), timeout=RESPONSE_TIMEOUT
-                )
-            except asyncio.TimeoutError as exc:
-                raise TimeoutError(
-                    f"Timed out waiting for response to {payload.get('type')}"
-                ) from exc
-
-            response = json.loads(response_raw)
-            if response.get("requestId") != request_id:
-                raise RuntimeError(
-                    "Received mismatched response from A-Frame bridge"
-                )
-
-            if response.get("status") == "error":
-                raise RuntimeError(response.get("message", "Unknown bridge error"))
-            return response.get("result", {})
+        # requestId goes first so the bridge's byte scan finds it before any
+        # nested key of the same name inside params.
+        payload = {"requestId": payload.get("requestId") or _next_request_id(), **payload}
+        request_id = payload["requestId"]
+        websocket = await self._connect()
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            await websocket.send(dumps(payload))
+            async with async_timeout.timeout(RESPONSE_TIMEOUT):
+                response = await future
+        except asyncio.TimeoutError as exc:
+            raise TimeoutError(
+                f"Timed out waiting for response to {payload.get('type')}"
+            ) from exc
+        except websockets.ConnectionClosed as exc:
+            raise ConnectionError("Bridge connection closed") from exc
+        finally:
+            self._pending.pop(request_id, None)
+
+        if response.get("status") == "error":
+            raise RuntimeError(response.get("message", "Unknown bridge error"))
+
+        result = response.get("result", {})
+        if "binaryPayload" in response:
+            result["image_bytes"] = response["binaryPayload"]
+        return result
 
     def send_command(self, command_type: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Send a command synchronously, hiding asyncio plumbing."""
 
-        async def runner() -> Dict[str, Any]:
-            payload = {"type": command_type, "params": params or {}}
-            return await self._send(payload)
-
-        loop = asyncio.new_event_loop()
+        payload = {"type": command_type, "params": params or {}}
+
+        cache_key: Optional[Tuple[str, bytes]] = None
+        if command_type in CACHEABLE_COMMANDS and CACHE_TTL > 0:
+            cache_key = (command_type, dumps(payload["params"]))
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                version, stored_at, result = cached
+                if version == self._cache_version and time.monotonic() - stored_at < CACHE_TTL:
+                    return result
+        elif command_type not in READ_ONLY_COMMANDS:
+            # Invalidate before sending so reads racing the mutation are not stored.
+            self._cache_version += 1
+            self._cache.clear()
+
+        version = self._cache_version
+        future = asyncio.run_coroutine_threadsafe(self._send(payload), _background_loop())
         try:
-            return loop.run_until_complete(runner())
-        finally:
-            loop.close()
+            result = future.result(timeout=COMMAND_TIMEOUT)
+        except concurrent.futures.TimeoutError as exc:
+            future.cancel()
+            raise TimeoutError(f"Timed out waiting for response to {command_type}") from exc
+
+        if cache_key is not None:
+            self._cache[cache_key] = (version, time.monotonic(), result)
+        return result
 
 
 def get_connection() -> AFrameConnection:
@@ -112,17 +299,49 @@ def get_connection() -> AFrameConnection:
 _connection: Optional[AFrameConnection] = None
 
 
+def _format_result(result: Dict[str, Any]) -> str:
+    """Serialize a tool result, compact unless AFRAME_PRETTY_JSON is set."""
+
+    if PRETTY_JSON:
+        return dumps_pretty(result)
+    return dumps(result).decode()
+
+
+async def _probe_bridge(url: str, timeout: float = 1.0) -> bool:
+    """Check that the bridge accepts TCP connections, without a websocket handshake.
+
+    Returns False without probing when the URL has no host.
+    """
+
+    parsed = urlparse(url)
+    if parsed.hostname is None:
+        return False
+    port = parsed.port or (443 if parsed.scheme == "wss" else 80)
+    async with async_timeout.timeout(timeout):
+        _, writer = await asyncio.open_connection(parsed.hostname, port)
+    writer.close()
+    await writer.wait_closed()
+    return True
+
+
 @asynccontextmanager
 async def lifespan(server: FastMCP) -> AsyncIterator[Dict[str, Any]]:
-    """Attempt an eager handshake to validate the bridge."""
+    """Probe the bridge so misconfiguration is reported at startup."""
 
     conn = get_connection()
     try:
-        conn.send_command("ping")
-        logger.info("Connected to A-Frame bridge at %s", conn.bridge_url)
-    except Exception as exc:  # pragma: no cover - connection optional at startup
+        if await _probe_bridge(conn.bridge_url):
+            logger.info("A-Frame bridge reachable at %s", conn.bridge_url)
+        else:
+            logger.warning(
+                "AFRAME_BRIDGE_URL has no host, skipping startup probe: %s", conn.bridge_url
+            )
+    except asyncio.TimeoutError:  # pragma: no cover - connection optional at startup
+        logger.warning("A-Frame bridge not reachable on startup: timed out")
+        logger.warning("Commands will fail until the bridge is running and a scene connects")
+    except (OSError, ValueError) as exc:  # pragma: no cover - connection optional at startup
         logger.warning("A-Frame bridge not reachable on startup: %s", exc)
-        logger.warning("Commands will fail until a scene connects to the bridge")
+        logger.warning("Commands will fail until the bridge is running and a scene connects")
 
     yield {}
 
@@ -153,7 +372,7 @@ def get_scene_graph(ctx: Context) -> str:
 
     conn = get_connection()
     result = conn.send_command("get_scene_graph")
-    return json.dumps(result, indent=2)
+    return _format_result(result)
 
 
 @mcp.tool()
@@ -162,7 +381,7 @@ def find_entity(ctx: Context, selector: str) -> str:
 
     conn = get_connection()
     result = conn.send_command("find_entity", {"selector": selector})
-    return json.dumps(result, indent=2)
+    return _format_result(result)
 
 
 @mcp.tool()
@@ -183,7 +402,7 @@ def create_entity(
             "attributes": attributes or {},
         },
     )
-    return json.dumps(result, indent=2)
+    return _format_result(result)
 
 
 @mcp.tool()
@@ -204,7 +423,7 @@ def update_component(
             "data": data,
         },
     )
-    return json.dumps(result, indent=2)
+    return _format_result(result)
 
 
 @mcp.tool()
@@ -213,7 +432,7 @@ def remove_entity(ctx: Context, selector: str) -> str:
 
     conn = get_connection()
     result = conn.send_command("remove_entity", {"selector": selector})
-    return json.dumps(result, indent=2)
+    return _format_result(result)
 
 
 @mcp.tool()
@@ -236,7 +455,7 @@ def load_remote_asset(
             "options": options or {},
         },
     )
-    return json.dumps(result, indent=2)
+    return _format_result(result)
 
 
 @mcp.tool()
@@ -245,7 +464,7 @@ def execute_script(ctx: Context, code: str) -> str:
 
     conn = get_connection()
     result = conn.send_command("execute_script", {"code": code})
-    return json.dumps(result, indent=2)
+    return _format_result(result)
 
 
 @mcp.tool()
@@ -260,10 +479,10 @@ def capture_view(ctx: Context, width: int = 1280, height: int = 720) -> Image:
             "height": height,
         },
     )
-    image_b64 = result.get("image")
-    if not image_b64:
+    image_bytes = result.get("image_bytes")
+    if not image_bytes:
         raise RuntimeError("Bridge returned no image data")
-    return Image(data=base64.b64decode(image_b64), format="png")
+    return Image(data=image_bytes, format="png")
 
 
 @mcp.tool()
@@ -272,7 +491,7 @@ def list_assets(ctx: Context) -> str:
 
     conn = get_connection()
     result = conn.send_command("list_assets")
-    return json.dumps(result, indent=2)
+    return _format_result(result)
 
 
 @mcp.tool()
@@ -281,7 +500,7 @@ def focus_camera(ctx: Context, selector: str) -> str:
 
     conn = get_connection()
     result = conn.send_command("focus_camera", {"selector": selector})
-    return json.dumps(result, indent=2)
+    return _format_result(result)
 
 
 @mcp.tool()
@@ -290,7 +509,7 @@ def ping_bridge(ctx: Context) -> str:
 
     conn = get_connection()
     result = conn.send_command("ping")
-    return json.dumps(result, indent=2)
+    return _format_result(result)
 
 
 def main() -> None:
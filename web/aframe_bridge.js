@@ -61,6 +61,13 @@
     return assets;
   };
 
+  const textDecoder = new TextDecoder();
+
+  const decodeFrame = (data) => (typeof data === 'string' ? data : textDecoder.decode(data));
+
+  // Matches the leading requestId the bridge forwards without validating the rest.
+  const LEADING_REQUEST_ID = /^\s*\{\s*"requestId"\s*:\s*"([^"\\]+)"/;
+
   const generateId = (prefix) => {
     const uid = Math.random().toString(36).slice(2, 9);
     return `${prefix}-${uid}`;
@@ -196,12 +203,16 @@
       if (sceneEl.renderer && width && height) {
         sceneEl.renderer.setSize(width, height, false);
       }
-      const dataUrl = canvas.toDataURL('image/png');
+      // toBlob snapshots the canvas immediately, so the size can be restored before encoding finishes.
+      const pngBlob = new Promise((resolve) => canvas.toBlob(resolve, 'image/png'));
       if (sceneEl.renderer && prevWidth && prevHeight) {
         sceneEl.renderer.setSize(prevWidth, prevHeight, false);
       }
-      const [, base64] = dataUrl.split(',');
-      return { image: base64 };
+      const blob = await pngBlob;
+      if (!blob) {
+        throw new Error('Failed to encode canvas as PNG');
+      }
+      return blob;
     },
 
     focus_camera: async ({ selector }) => {
@@ -233,6 +244,8 @@
 
   const connect = () => {
     const socket = new WebSocket(BRIDGE_URL);
+    // The bridge sends compact JSON as binary frames; decode them as UTF-8.
+    socket.binaryType = 'arraybuffer';
 
     socket.addEventListener('open', () => {
       socket.send(
@@ -243,35 +256,34 @@
       );
     });
 
-    socket.addEventListener('message', async (event) => {
-      let message;
-      try {
-        message = JSON.parse(event.data);
-      } catch (err) {
-        console.warn('[AFrame MCP] Received invalid JSON message', event.data);
-        return;
-      }
+    const sendError = (requestId, message) => {
+      socket.send(JSON.stringify({ requestId, status: 'error', message }));
+    };
 
-      const { type, params = {}, requestId } = message;
+    const handleMessage = async (message) => {
+      const { type, params = {}, requestId } = message || {};
       if (!type || !requestId) {
         console.warn('[AFrame MCP] Message missing type or requestId', message);
+        if (requestId) {
+          sendError(requestId, 'Command must include type');
+        }
         return;
       }
 
       const handler = handlers[type];
       if (!handler) {
-        socket.send(
-          JSON.stringify({
-            requestId,
-            status: 'error',
-            message: `No handler registered for ${type}`,
-          })
-        );
+        sendError(requestId, `No handler registered for ${type}`);
         return;
       }
 
       try {
         const result = await handler(params || {});
+        if (result instanceof Blob) {
+          // Binary results are sent as a raw frame right after a header carrying the requestId.
+          socket.send(JSON.stringify({ requestId, status: 'ok', binary: true }));
+          socket.send(result);
+          return;
+        }
         socket.send(
           JSON.stringify({
             requestId,
@@ -281,14 +293,29 @@
         );
       } catch (error) {
         console.error('[AFrame MCP] Handler error', error);
-        socket.send(
-          JSON.stringify({
-            requestId,
-            status: 'error',
-            message: error?.message || 'Unknown error executing handler',
-          })
-        );
+        sendError(requestId, error?.message || 'Unknown error executing handler');
       }
+    };
+
+    socket.addEventListener('message', (event) => {
+      // The bridge coalesces commands that are ready together, one JSON document per line.
+      decodeFrame(event.data)
+        .split('\n')
+        .forEach((line) => {
+          if (!line.trim()) return;
+          let message;
+          try {
+            message = JSON.parse(line);
+          } catch (err) {
+            console.warn('[AFrame MCP] Received invalid JSON message', line);
+            const match = LEADING_REQUEST_ID.exec(line);
+            if (match) {
+              sendError(match[1], 'Invalid command payload');
+            }
+            return;
+          }
+          handleMessage(message);
+        });
     });
 
     socket.addEventListener('close', () => {